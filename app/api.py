@@ -0,0 +1,167 @@
+import asyncio
+
+import reflex as rx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+from app import staging
+from app.documents import serve_document
+
+
+def _error(e: staging.StagingError, headers: dict | None = None) -> JSONResponse:
+    return JSONResponse({"error": str(e)}, status_code=e.status_code, headers=headers)
+
+
+class _ChunkTooLarge(Exception):
+    pass
+
+
+async def _read_capped(request: Request, limit: int) -> bytes:
+    chunks = []
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise _ChunkTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+# Staging calls read and fsync files and wait on the session locks that the
+# sweep job and promote_uploads hold from worker threads, so they all run off
+# the event loop.
+
+
+async def _authorize(request: Request):
+    await asyncio.to_thread(
+        staging.check_ticket,
+        request.path_params["session"],
+        request.headers.get("Upload-Ticket", ""),
+    )
+
+
+def _offset_headers(upload: staging.StagedUpload) -> dict:
+    return {
+        "Upload-Offset": str(upload["offset"]),
+        "Upload-Length": str(upload["size"]),
+        "Cache-Control": "no-store",
+    }
+
+
+async def create_upload(request: Request) -> Response:
+    session = request.path_params["session"]
+    try:
+        await _authorize(request)
+        payload = await request.json()
+        upload = await asyncio.to_thread(
+            staging.create_upload,
+            session,
+            str(payload.get("filename", "")),
+            int(payload.get("size", 0)),
+        )
+    except (ValueError, TypeError, AttributeError):
+        return JSONResponse({"error": "Invalid upload request."}, status_code=400)
+    except staging.StagingError as e:
+        return _error(e)
+    headers = _offset_headers(upload)
+    headers["Location"] = f"{request.url.path}/{upload['upload_id']}"
+    return JSONResponse(upload, status_code=201, headers=headers)
+
+
+async def upload_status(request: Request) -> Response:
+    try:
+        await _authorize(request)
+        upload = await asyncio.to_thread(
+            staging.get_upload,
+            request.path_params["session"],
+            request.path_params["upload_id"],
+        )
+    except staging.StagingError as e:
+        return _error(e)
+    if request.method == "HEAD":
+        return Response(status_code=200, headers=_offset_headers(upload))
+    return JSONResponse(upload, headers=_offset_headers(upload))
+
+
+async def upload_chunk(request: Request) -> Response:
+    session = request.path_params["session"]
+    upload_id = request.path_params["upload_id"]
+    try:
+        offset = int(request.headers["Upload-Offset"])
+    except (KeyError, ValueError):
+        return JSONResponse(
+            {"error": "Upload-Offset header is required."}, status_code=400
+        )
+    try:
+        await _authorize(request)
+        limit = await asyncio.to_thread(
+            staging.max_chunk_size, session, upload_id, offset
+        )
+    except staging.StagingError as e:
+        return _error(e)
+    try:
+        data = await _read_capped(request, limit)
+    except _ChunkTooLarge:
+        return JSONResponse(
+            {"error": "Chunk exceeds the declared upload size."}, status_code=413
+        )
+    try:
+        new_offset = await asyncio.to_thread(
+            staging.write_chunk, session, upload_id, offset, data
+        )
+        upload = await asyncio.to_thread(staging.get_upload, session, upload_id)
+    except staging.StagingError as e:
+        headers = None
+        if e.status_code == 409:
+            try:
+                upload = await asyncio.to_thread(staging.get_upload, session, upload_id)
+            except staging.StagingError as missing:
+                # Discarded or swept since the write was refused.
+                return _error(missing)
+            headers = _offset_headers(upload)
+        return _error(e, headers=headers)
+    upload["offset"] = new_offset
+    return Response(status_code=204, headers=_offset_headers(upload))
+
+
+async def delete_upload(request: Request) -> Response:
+    try:
+        await _authorize(request)
+        await asyncio.to_thread(
+            staging.discard_upload,
+            request.path_params["session"],
+            request.path_params["upload_id"],
+        )
+    except staging.StagingError as e:
+        return _error(e)
+    return Response(status_code=204)
+
+
+uploads_api = Starlette(
+    routes=[
+        Route("/{session}", create_upload, methods=["POST"]),
+        Route("/{session}/{upload_id}", upload_status, methods=["GET", "HEAD"]),
+        Route("/{session}/{upload_id}", upload_chunk, methods=["PATCH", "PUT"]),
+        Route("/{session}/{upload_id}", delete_upload, methods=["DELETE"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=rx.config.get_config().cors_allowed_origins,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            expose_headers=["Upload-Offset", "Upload-Length", "Location"],
+        )
+    ],
+)
+
+api = Starlette(
+    routes=[
+        Mount("/api/uploads", app=uploads_api),
+        Route("/api/documents/{name}", serve_document, methods=["GET", "HEAD"]),
+    ]
+)
@@ -1,4 +1,9 @@
 import reflex as rx
+from app.api import api
+from app import dedup
+from app import maintenance  # registers the periodic maintenance jobs
+from app.audit import audit_log
+from app.jobs import scheduler
 from app.state import AuthState, protected_page
 from app.components.navbar import navbar
 from app.pages.login import login_page
@@ -63,8 +68,13 @@ app = rx.App(
             href="https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;500;700&display=swap",
             rel="stylesheet",
         ),
+        rx.el.script(src="/resumable_upload.js"),
     ],
+    api_transformer=api,
 )
+app.register_lifespan_task(scheduler.run)
+app.register_lifespan_task(audit_log.run)
+app.register_lifespan_task(dedup.ensure_schema)
 app.add_page(index, on_load=AuthState.on_load)
 app.add_page(login_page, route="/login")
 app.add_page(register_page, route="/register")
@@ -0,0 +1,351 @@
+import asyncio
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional, TextIO, TypedDict
+
+logger = logging.getLogger(__name__)
+
+AUDIT_DIR = Path("audit_log")
+INDEX_SUFFIX = ".idx"
+FLUSH_INTERVAL_SECONDS = 1.0
+FLUSH_BATCH_SIZE = 500
+SEGMENT_MAX_BYTES = 8 * 1024 * 1024
+SEGMENT_MAX_AGE_SECONDS = 24 * 60 * 60
+
+LOGIN = "auth.login"
+LOGIN_FAILED = "auth.login_failed"
+LOGOUT = "auth.logout"
+REQUEST_CREATE = "request.create"
+REQUEST_VIEW = "request.view"
+REQUEST_UPDATE = "request.update"
+REQUEST_EXPORT = "request.export"
+
+
+class AuditEvent(TypedDict):
+    ts: float
+    action: str
+    user_id: Optional[int]
+    request_id: Optional[int]
+    client_ip: str
+    details: dict
+
+
+class SegmentIndex(TypedDict):
+    count: int
+    min_ts: float
+    max_ts: float
+    user_ids: list[int]
+    request_ids: list[int]
+    compressed: bool
+
+
+def _matches(
+    event: AuditEvent,
+    user_id: Optional[int],
+    request_id: Optional[int],
+    since: Optional[float],
+    until: Optional[float],
+) -> bool:
+    return (
+        (user_id is None or event["user_id"] == user_id)
+        and (request_id is None or event["request_id"] == request_id)
+        and (since is None or event["ts"] >= since)
+        and (until is None or event["ts"] < until)
+    )
+
+
+class AuditLog:
+    def __init__(self, directory: Path = AUDIT_DIR):
+        self.directory = directory
+        self._buffer: list[AuditEvent] = []
+        self._active: Optional[str] = None
+        self._active_file: Optional[TextIO] = None
+        self._active_entry: Optional[SegmentIndex] = None
+        self._active_started = 0.0
+        self._index_cache: dict[str, tuple[int, SegmentIndex]] = {}
+        # Flushes run in a worker thread and queries may run in another.
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+
+    def record(
+        self,
+        action: str,
+        user_id: Optional[int] = None,
+        request_id: Optional[int] = None,
+        client_ip: str = "",
+        **details: Any,
+    ):
+        self._buffer.append(
+            AuditEvent(
+                ts=time.time(),
+                action=action,
+                user_id=user_id,
+                request_id=request_id,
+                client_ip=client_ip,
+                details=details,
+            )
+        )
+        if len(self._buffer) >= FLUSH_BATCH_SIZE and self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        await asyncio.to_thread(self._recover)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), FLUSH_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                await self.flush()
+        finally:
+            self._write_batch(self._take_buffer())
+
+    def _take_buffer(self) -> list[AuditEvent]:
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    async def flush(self):
+        batch = self._take_buffer()
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception:
+            logger.exception("Failed to flush %d audit events.", len(batch))
+            self._buffer[:0] = batch
+
+    # Every worker process writes its own segments, and each segment carries
+    # its own index file, so no file is ever written by two processes. The
+    # owner holds an flock on its open segment for as long as it appends to
+    # it; a segment nobody holds belongs to a dead process and can be sealed.
+
+    def _index_path(self, name: str) -> Path:
+        return self.directory / f"{name}{INDEX_SUFFIX}"
+
+    def _save_index(self, name: str, entry: SegmentIndex):
+        tmp_path = self.directory / f"{name}{INDEX_SUFFIX}.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, self._index_path(name))
+
+    def _load_indexes(self) -> dict[str, SegmentIndex]:
+        indexes = {}
+        for path in self.directory.glob(f"segment-*.jsonl{INDEX_SUFFIX}"):
+            name = path.name.removesuffix(INDEX_SUFFIX)
+            try:
+                mtime = path.stat().st_mtime_ns
+                cached = self._index_cache.get(name)
+                if cached is None or cached[0] != mtime:
+                    with path.open("r", encoding="utf-8") as f:
+                        cached = (mtime, json.load(f))
+                    self._index_cache[name] = cached
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            indexes[name] = cached[1]
+        for name in self._index_cache.keys() - indexes.keys():
+            del self._index_cache[name]
+        return indexes
+
+    def _recover(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob("segment-*.jsonl")):
+            if path.name == self._active:
+                continue
+            try:
+                f = path.open("r", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another worker is still appending to it.
+                    continue
+                # Another worker may have sealed it while we waited.
+                if (
+                    not path.exists()
+                    or os.stat(path).st_ino != os.fstat(f.fileno()).st_ino
+                ):
+                    continue
+                self._seal(path.name, self._scan_segment(path))
+        # Index files whose segment is gone are leftovers from a crash.
+        for path in self.directory.glob(f"segment-*.jsonl{INDEX_SUFFIX}"):
+            name = path.name.removesuffix(INDEX_SUFFIX)
+            if (
+                not (self.directory / name).exists()
+                and not (self.directory / f"{name}.gz").exists()
+            ):
+                path.unlink(missing_ok=True)
+
+    def _scan_segment(self, path: Path) -> SegmentIndex:
+        entry = SegmentIndex(
+            count=0,
+            min_ts=float("inf"),
+            max_ts=0.0,
+            user_ids=[],
+            request_ids=[],
+            compressed=False,
+        )
+        user_ids, request_ids = set(), set()
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a torn final line; skip it.
+                    continue
+                self._index_event(entry, event, user_ids, request_ids)
+        return entry
+
+    def _index_event(
+        self,
+        entry: SegmentIndex,
+        event: AuditEvent,
+        user_ids: set[int],
+        request_ids: set[int],
+    ):
+        entry["count"] += 1
+        entry["min_ts"] = min(entry["min_ts"], event["ts"])
+        entry["max_ts"] = max(entry["max_ts"], event["ts"])
+        if event["user_id"] is not None and event["user_id"] not in user_ids:
+            user_ids.add(event["user_id"])
+            entry["user_ids"].append(event["user_id"])
+        if event["request_id"] is not None and event["request_id"] not in request_ids:
+            request_ids.add(event["request_id"])
+            entry["request_ids"].append(event["request_id"])
+
+    def _seal(self, name: str, entry: SegmentIndex):
+        source = self.directory / name
+        target = self.directory / f"{name}.gz"
+        tmp_target = self.directory / f"{name}.gz.tmp"
+        with source.open("rb") as src, gzip.open(tmp_target, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_target, target)
+        entry["compressed"] = True
+        self._save_index(name, entry)
+        source.unlink()
+
+    def _write_batch(self, batch: list[AuditEvent]):
+        if not batch:
+            return
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            if self._active is not None and (
+                self._active_file.tell() >= SEGMENT_MAX_BYTES
+                or time.time() - self._active_started >= SEGMENT_MAX_AGE_SECONDS
+            ):
+                self._seal(self._active, self._active_entry)
+                self._active_file.close()
+                self._active = None
+            if self._active is None:
+                self._active = f"segment-{time.time_ns()}-{os.getpid()}.jsonl"
+                self._active_file = (self.directory / self._active).open(
+                    "a", encoding="utf-8"
+                )
+                fcntl.flock(self._active_file, fcntl.LOCK_EX)
+                self._active_started = time.time()
+                self._active_entry = SegmentIndex(
+                    count=0,
+                    min_ts=float("inf"),
+                    max_ts=0.0,
+                    user_ids=[],
+                    request_ids=[],
+                    compressed=False,
+                )
+            entry = self._active_entry
+            user_ids, request_ids = set(entry["user_ids"]), set(entry["request_ids"])
+            f = self._active_file
+            for event in batch:
+                f.write(json.dumps(event, separators=(",", ":")) + "\n")
+                self._index_event(entry, event, user_ids, request_ids)
+            f.flush()
+            os.fsync(f.fileno())
+            self._save_index(self._active, entry)
+
+    def _read_segment(self, name: str):
+        # The index may still say uncompressed for a segment that was sealed
+        # a moment ago; the data file that exists is the one to read.
+        try:
+            f = (self.directory / name).open("r", encoding="utf-8")
+        except FileNotFoundError:
+            f = gzip.open(self.directory / f"{name}.gz", "rt", encoding="utf-8")
+        with f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # A segment another worker is appending to may end in a
+                    # partly written line.
+                    continue
+
+    def _query(
+        self,
+        pending: list[AuditEvent],
+        user_id: Optional[int],
+        request_id: Optional[int],
+        since: Optional[float],
+        until: Optional[float],
+        limit: int,
+    ) -> list[AuditEvent]:
+        results = [
+            event
+            for event in pending
+            if _matches(event, user_id, request_id, since, until)
+        ]
+        results.sort(key=lambda event: event["ts"], reverse=True)
+        del results[limit:]
+        with self._lock:
+            # Segments from different workers overlap in time, so visit them
+            # newest-event first and stop once none can beat the current
+            # limit-th result.
+            segments = sorted(
+                self._load_indexes().items(),
+                key=lambda item: item[1]["max_ts"],
+                reverse=True,
+            )
+            for name, entry in segments:
+                if len(results) >= limit and entry["max_ts"] < results[-1]["ts"]:
+                    break
+                if (
+                    entry["count"] == 0
+                    or (since is not None and entry["max_ts"] < since)
+                    or (until is not None and entry["min_ts"] >= until)
+                    or (user_id is not None and user_id not in entry["user_ids"])
+                    or (
+                        request_id is not None
+                        and request_id not in entry["request_ids"]
+                    )
+                ):
+                    continue
+                results.extend(
+                    event
+                    for event in self._read_segment(name)
+                    if _matches(event, user_id, request_id, since, until)
+                )
+                results.sort(key=lambda event: event["ts"], reverse=True)
+                del results[limit:]
+        return results
+
+    async def query(
+        self,
+        user_id: Optional[int] = None,
+        request_id: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 1000,
+    ) -> list[AuditEvent]:
+        return await asyncio.to_thread(
+            self._query, list(self._buffer), user_id, request_id, since, until, limit
+        )
+
+
+audit_log = AuditLog()
@@ -0,0 +1,240 @@
+import datetime
+import hashlib
+import heapq
+import random
+import re
+import struct
+from typing import Optional, TypedDict
+
+import reflex as rx
+from sqlmodel import select
+
+from .jobs import job, once
+from .models import DB_URL, RequestSignature, sqlite_connection
+
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+# Bound the work per signature for long notes: only the first MAX_TOKENS words
+# are shingled, and only the MAX_SHINGLES shingles with the lowest base hashes
+# are permuted. The latter is a consistent sample, so two notes are still
+# compared on the same shingles.
+MAX_TOKENS = 1000
+MAX_SHINGLES = 128
+SIMILARITY_THRESHOLD = 0.6
+WINDOW_DAYS = 30
+MAX_CANDIDATES = 50
+BACKFILL_BATCH_SIZE = 1000
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+# Fixed seed: stored signatures are only comparable if every process draws
+# the same permutations.
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+_SIGNATURE_FORMAT = f"<{NUM_PERMUTATIONS}I"
+_TOKEN_RE = re.compile(r"\w+")
+_PATIENT_ID_RE = re.compile(r"[^A-Za-z0-9]")
+
+
+class DuplicateMatch(TypedDict):
+    request_id: int
+    created_at: str
+    similarity: float
+
+
+def normalize_patient_id(patient_id_number: str) -> str:
+    return _PATIENT_ID_RE.sub("", patient_id_number).upper()
+
+
+def _shingles(text: str) -> set[str]:
+    tokens = _TOKEN_RE.findall(text.lower())[:MAX_TOKENS]
+    if not tokens:
+        return set()
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)}
+    return {
+        " ".join(shingle) for shingle in zip(*(tokens[i:] for i in range(SHINGLE_SIZE)))
+    }
+
+
+def minhash(text: str) -> bytes:
+    # Text without any words has no signature (b"") and never matches.
+    hashes = heapq.nsmallest(
+        MAX_SHINGLES,
+        (
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(),
+                "little",
+            )
+            for shingle in _shingles(text)
+        ),
+    )
+    if not hashes:
+        return b""
+    signature = [
+        min([(a * h + b) % _MERSENNE_PRIME for h in hashes]) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ]
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def similarity(left: bytes, right: bytes) -> float:
+    if not left or not right:
+        return 0.0
+    left_values = struct.unpack(_SIGNATURE_FORMAT, left)
+    right_values = struct.unpack(_SIGNATURE_FORMAT, right)
+    return sum(a == b for a, b in zip(left_values, right_values)) / NUM_PERMUTATIONS
+
+
+def _window_start(created_at: str) -> str:
+    moment = datetime.datetime.fromisoformat(created_at)
+    return (moment - datetime.timedelta(days=WINDOW_DAYS)).isoformat()
+
+
+def rank_duplicates(
+    signature: bytes, candidates: list[tuple[int, str, bytes]]
+) -> list[DuplicateMatch]:
+    matches = []
+    for request_id, created_at, candidate in candidates:
+        score = similarity(signature, candidate)
+        if score >= SIMILARITY_THRESHOLD:
+            matches.append(
+                DuplicateMatch(
+                    request_id=request_id, created_at=created_at, similarity=score
+                )
+            )
+    matches.sort(key=lambda match: match["similarity"], reverse=True)
+    return matches
+
+
+async def find_duplicates(
+    session, patient_id_number: str, signature: bytes, created_at: str
+) -> list[DuplicateMatch]:
+    if not signature:
+        return []
+    result = await session.exec(
+        select(
+            RequestSignature.request_id,
+            RequestSignature.created_at,
+            RequestSignature.minhash,
+        )
+        .where(
+            RequestSignature.patient_id_number == patient_id_number,
+            RequestSignature.created_at >= _window_start(created_at),
+            RequestSignature.created_at <= created_at,
+        )
+        .order_by(RequestSignature.created_at.desc())
+        .limit(MAX_CANDIDATES)
+    )
+    return rank_duplicates(signature, list(result.all()))
+
+
+def build_signature(
+    request_id: int,
+    patient_id_number: str,
+    created_at: str,
+    signature: bytes,
+    matches: list[DuplicateMatch],
+) -> RequestSignature:
+    best: Optional[DuplicateMatch] = matches[0] if matches else None
+    return RequestSignature(
+        request_id=request_id,
+        patient_id_number=patient_id_number,
+        created_at=created_at,
+        minhash=signature,
+        duplicate_of=best["request_id"] if best else None,
+        similarity=best["similarity"] if best else 0.0,
+    )
+
+
+async def ensure_schema():
+    async with rx.asession(DB_URL) as session:
+        await session.run_sync(
+            lambda s: RequestSignature.__table__.create(s.connection(), checkfirst=True)
+        )
+        await session.commit()
+
+
+@job("dedup.backfill")
+def backfill_signatures(context):
+    # Submissions sign their request in the same transaction as the insert, so
+    # only rows from before this feature need a signature: one pass in id
+    # order is enough.
+    processed = 0
+    last_id = 0
+    with sqlite_connection() as conn:
+        (max_id,) = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM medicalrequest"
+        ).fetchone()
+        while True:
+            rows = conn.execute(
+                "SELECT m.id, m.patient_id_number, m.symptoms, m.created_at "
+                "FROM medicalrequest m "
+                "LEFT JOIN requestsignature s ON s.request_id = m.id "
+                "WHERE m.id > ? AND s.request_id IS NULL ORDER BY m.id LIMIT ?",
+                (last_id, BACKFILL_BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            # Sign the whole batch before taking the write lock, so concurrent
+            # submissions only wait for the insert itself. Rows of the same
+            # batch are not in the table yet; they are candidates from memory.
+            signed: list[RequestSignature] = []
+            batch_candidates: dict[str, list[tuple[int, str, bytes]]] = {}
+            for request_id, patient_id_number, symptoms, created_at in rows:
+                patient_id_number = normalize_patient_id(patient_id_number)
+                signature = minhash(symptoms)
+                window_start = _window_start(created_at)
+                candidates = conn.execute(
+                    "SELECT request_id, created_at, minhash FROM requestsignature "
+                    "WHERE patient_id_number = ? AND created_at >= ? "
+                    "AND created_at <= ? ORDER BY created_at DESC LIMIT ?",
+                    (patient_id_number, window_start, created_at, MAX_CANDIDATES),
+                ).fetchall()
+                pending = batch_candidates.setdefault(patient_id_number, [])
+                candidates.extend(
+                    candidate
+                    for candidate in pending
+                    if window_start <= candidate[1] <= created_at
+                )
+                candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+                signed.append(
+                    build_signature(
+                        request_id,
+                        patient_id_number,
+                        created_at,
+                        signature,
+                        rank_duplicates(signature, candidates[:MAX_CANDIDATES]),
+                    )
+                )
+                pending.append((request_id, created_at, signature))
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO requestsignature (request_id, patient_id_number, "
+                "created_at, minhash, duplicate_of, similarity) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        row.request_id,
+                        row.patient_id_number,
+                        row.created_at,
+                        row.minhash,
+                        row.duplicate_of,
+                        row.similarity,
+                    )
+                    for row in signed
+                ],
+            )
+            conn.execute("COMMIT")
+            processed += len(rows)
+            last_id = rows[-1][0]
+            context.set_progress(
+                last_id / max(max_id, last_id), f"Signed {processed} requests"
+            )
+    return {"processed": processed}
+
+
+once("dedup.backfill")
@@ -0,0 +1,261 @@
+import asyncio
+import gzip
+import hashlib
+import hmac
+import mimetypes
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+from typing import Optional
+
+import reflex as rx
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from . import staging
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+COMPRESSIBLE_TYPES = {"application/pdf", "application/json", "image/svg+xml"}
+MIN_COMPRESS_BYTES = 1024
+MAX_COMPRESS_BYTES = staging.MAX_UPLOAD_SIZE
+# Scanned PDFs are mostly already-compressed images; only keep a variant when
+# it saves a meaningful share of the transfer.
+MIN_COMPRESSION_SAVING = 0.1
+COMPRESSED_CACHE_DIR = ".compressed"
+COMPRESSED_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60
+# Links expire between one and two TTLs after they are issued; rounding the
+# expiry keeps a document's URL, and so the browser cache entry, stable for
+# an hour.
+DOCUMENT_URL_TTL_SECONDS = 60 * 60
+URL_SECRET_NAME = ".document_url_secret"
+
+_CONTENT_ADDRESSED_RE = re.compile(
+    rf"^([0-9a-f]{{{staging.CONTENT_HASH_LENGTH}}})_(.+)$"
+)
+_ENCODED_ETAG_RE = re.compile(r'-(?:gzip|br)"$')
+
+_variant_locks: dict[str, threading.Lock] = {}
+_variant_locks_guard = threading.Lock()
+
+
+def _url_secret() -> bytes:
+    secret = os.environ.get("DOCUMENT_URL_SECRET")
+    if secret:
+        return secret.encode("utf-8")
+    # Generated once per upload directory, which every worker shares.
+    path = rx.get_upload_dir() / URL_SECRET_NAME
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return path.read_bytes()
+    secret = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(secret)
+    return secret
+
+
+def _sign(name: str, expires: int) -> str:
+    return hmac.new(
+        _url_secret(), f"{name}:{expires}".encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def _signature_valid(name: str, expires: str, token: str) -> bool:
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(_sign(name, int(expires)), token)
+
+
+def document_url(name: str) -> str:
+    expires = (int(time.time()) // DOCUMENT_URL_TTL_SECONDS + 2) * (
+        DOCUMENT_URL_TTL_SECONDS
+    )
+    query = urllib.parse.urlencode({"expires": expires, "token": _sign(name, expires)})
+    return (
+        f"{rx.config.get_config().api_url}/api/documents/"
+        f"{urllib.parse.quote(name)}?{query}"
+    )
+
+
+def document_path(name: str) -> Optional[Path]:
+    if not name or name != Path(name).name or name.startswith("."):
+        return None
+    path = rx.get_upload_dir() / name
+    return path if path.is_file() else None
+
+
+def _etag(name: str, stat: os.stat_result) -> tuple[str, bool]:
+    match = _CONTENT_ADDRESSED_RE.match(name)
+    if match:
+        return f'"{match.group(1)}"', True
+    return f'W/"{stat.st_mtime_ns:x}-{stat.st_size:x}"', False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison; encoded variants share a validator
+    # with the identity representation.
+    wanted = etag.removeprefix("W/")
+    return any(
+        _ENCODED_ETAG_RE.sub('"', tag.strip().removeprefix("W/")) == wanted
+        for tag in if_none_match.split(",")
+    )
+
+
+def _accepted_encodings(accept_encoding: str) -> list[str]:
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        weight = 1.0
+        if params.strip().startswith("q="):
+            try:
+                weight = float(params.strip()[2:])
+            except ValueError:
+                weight = 0.0
+        weights[token.strip().lower()] = weight
+    encodings = []
+    if brotli is not None and weights.get("br", 0) > 0:
+        encodings.append("br")
+    if weights.get("gzip", 0) > 0:
+        encodings.append("gzip")
+    return encodings
+
+
+def _is_compressible(media_type: str) -> bool:
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+def _compressed_variant(path: Path, etag: str, encoding: str) -> Optional[Path]:
+    cache_dir = rx.get_upload_dir() / COMPRESSED_CACHE_DIR
+    key = hashlib.sha256(f"{path.name}:{etag}".encode("utf-8")).hexdigest()[:32]
+    variant = cache_dir / f"{key}.{encoding}"
+    if variant.exists():
+        return variant
+    # Concurrent first views of the same document wait for one compression
+    # instead of each reading and compressing up to 50 MB.
+    with _variant_locks_guard:
+        lock = _variant_locks.setdefault(variant.name, threading.Lock())
+    try:
+        with lock:
+            return _compress_variant(path, cache_dir, key, encoding)
+    finally:
+        with _variant_locks_guard:
+            _variant_locks.pop(variant.name, None)
+
+
+def _compress_variant(
+    path: Path, cache_dir: Path, key: str, encoding: str
+) -> Optional[Path]:
+    variant = cache_dir / f"{key}.{encoding}"
+    skip_marker = cache_dir / f"{key}.{encoding}.skip"
+    if variant.exists():
+        return variant
+    if skip_marker.exists():
+        return None
+    data = path.read_bytes()
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=5)
+    else:
+        compressed = gzip.compress(data, compresslevel=6, mtime=0)
+    cache_dir.mkdir(exist_ok=True)
+    if len(compressed) > len(data) * (1 - MIN_COMPRESSION_SAVING):
+        skip_marker.touch()
+        return None
+    # A worker process compressing the same document writes its own temp
+    # file; whichever replace lands last wins with identical bytes.
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, prefix=f"{key}.{encoding}.", suffix=".tmp", delete=False
+    ) as f:
+        f.write(compressed)
+    try:
+        os.replace(f.name, variant)
+    except OSError:
+        os.unlink(f.name)
+        raise
+    return variant
+
+
+def prune_compressed_cache(max_age: float = COMPRESSED_CACHE_TTL_SECONDS) -> int:
+    cache_dir = rx.get_upload_dir() / COMPRESSED_CACHE_DIR
+    if not cache_dir.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for path in cache_dir.iterdir():
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+async def serve_document(request: Request) -> Response:
+    name = request.path_params["name"]
+    if not _signature_valid(
+        name,
+        request.query_params.get("expires", ""),
+        request.query_params.get("token", ""),
+    ):
+        return Response(status_code=403)
+    path = document_path(name)
+    if path is None:
+        return Response(status_code=404)
+    stat = path.stat()
+    etag, immutable = _etag(name, stat)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": (
+            IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        ),
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+    match = _CONTENT_ADDRESSED_RE.match(name)
+    filename = match.group(2) if match else name
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if (
+        "range" not in request.headers
+        and _is_compressible(media_type)
+        and MIN_COMPRESS_BYTES <= stat.st_size <= MAX_COMPRESS_BYTES
+    ):
+        for encoding in _accepted_encodings(request.headers.get("accept-encoding", "")):
+            variant = await asyncio.to_thread(_compressed_variant, path, etag, encoding)
+            if variant is None:
+                continue
+            try:
+                # The cache pruner may have removed it since; treat that as a miss.
+                variant_stat = variant.stat()
+            except FileNotFoundError:
+                continue
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            return FileResponse(
+                variant,
+                media_type=media_type,
+                headers=headers,
+                filename=filename,
+                content_disposition_type="inline",
+                stat_result=variant_stat,
+            )
+    # FileResponse answers Range/If-Range itself and hands the file to the
+    # server's zero-copy path (ASGI pathsend) when the server supports it.
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers=headers,
+        filename=filename,
+        content_disposition_type="inline",
+        stat_result=stat,
+    )
@@ -0,0 +1,455 @@
+import asyncio
+import datetime
+import inspect
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, TypedDict
+
+import reflex as rx
+from sqlalchemy import and_, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import select
+
+from .models import DB_URL, Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 2.0
+LEASE_SECONDS = 60.0
+MAX_WORKERS = 4
+ONCE_KEY_SUFFIX = "@once"
+
+
+class JobInfo(TypedDict):
+    id: int
+    job_type: str
+    status: str
+    progress: float
+    message: str
+    attempts: int
+    result: str
+    error: str
+
+
+@dataclass
+class JobSpec:
+    job_type: str
+    handler: Callable
+    concurrency: int = 1
+    max_attempts: int = 3
+    backoff_seconds: float = 30.0
+    timeout_seconds: Optional[float] = None
+
+
+_CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+
+def _parse_cron_field(token: str, low: int, high: int) -> set[int]:
+    values = set()
+    for part in token.split(","):
+        base, _, step = part.partition("/")
+        if base == "*":
+            start, end = low, high
+        elif "-" in base:
+            start, end = (int(v) for v in base.split("-", 1))
+        else:
+            start = int(base)
+            end = high if step else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field {token!r} is out of range {low}-{high}.")
+        values.update(range(start, end + 1, int(step or 1)))
+    return values
+
+
+@dataclass
+class CronSchedule:
+    minutes: set[int]
+    hours: set[int]
+    days: set[int]
+    months: set[int]
+    weekdays: set[int]
+    any_day: bool = True
+    any_weekday: bool = True
+
+    @classmethod
+    def parse(cls, expression: str) -> "CronSchedule":
+        tokens = expression.split()
+        if len(tokens) != 5:
+            raise ValueError(f"Cron expression {expression!r} must have 5 fields.")
+        fields = [
+            _parse_cron_field(token, low, high)
+            for token, (low, high) in zip(tokens, _CRON_RANGES)
+        ]
+        return cls(*fields, any_day=tokens[2] == "*", any_weekday=tokens[4] == "*")
+
+    def _day_matches(self, moment: datetime.datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if not self.any_day and not self.any_weekday:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, moment: datetime.datetime) -> datetime.datetime:
+        candidate = moment.replace(second=0, microsecond=0) + datetime.timedelta(
+            minutes=1
+        )
+        limit = candidate + datetime.timedelta(days=366 * 5)
+        while candidate < limit:
+            if candidate.month not in self.months:
+                year = candidate.year + candidate.month // 12
+                candidate = candidate.replace(
+                    year=year, month=candidate.month % 12 + 1, day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = candidate.replace(hour=0, minute=0) + datetime.timedelta(
+                    days=1
+                )
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + datetime.timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += datetime.timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError("Cron schedule never fires.")
+
+
+@dataclass
+class PeriodicTask:
+    schedule: CronSchedule
+    job_type: str
+    payload: dict = field(default_factory=dict)
+    priority: int = 0
+    next_run: Optional[datetime.datetime] = None
+
+
+_registry: dict[str, JobSpec] = {}
+_periodic: list[PeriodicTask] = []
+_once: list[str] = []
+
+
+def job(
+    job_type: str,
+    *,
+    concurrency: int = 1,
+    max_attempts: int = 3,
+    backoff_seconds: float = 30.0,
+    timeout_seconds: Optional[float] = None,
+):
+    def decorator(handler: Callable) -> Callable:
+        # A timed-out thread cannot be cancelled: it would keep running while
+        # its lease and concurrency slot are handed to a retry.
+        if timeout_seconds is not None and not inspect.iscoroutinefunction(handler):
+            raise ValueError(
+                f"Job {job_type!r} runs in a thread; timeout_seconds requires "
+                "an async handler."
+            )
+        _registry[job_type] = JobSpec(
+            job_type=job_type,
+            handler=handler,
+            concurrency=concurrency,
+            max_attempts=max_attempts,
+            backoff_seconds=backoff_seconds,
+            timeout_seconds=timeout_seconds,
+        )
+        return handler
+
+    return decorator
+
+
+def periodic(
+    cron: str, job_type: str, payload: Optional[dict] = None, priority: int = 0
+):
+    _periodic.append(
+        PeriodicTask(CronSchedule.parse(cron), job_type, payload or {}, priority)
+    )
+
+
+def once(job_type: str):
+    # Enqueued at startup under a fixed dedupe key, so it runs once per
+    # database rather than once per process. maintenance.prune_jobs keeps the
+    # succeeded row, which is what stops later startups from enqueueing it.
+    _once.append(job_type)
+
+
+class JobContext:
+    def __init__(self, scheduler: "JobScheduler", job_id: int):
+        self.scheduler = scheduler
+        self.job_id = job_id
+
+    def set_progress(self, progress: float, message: str = ""):
+        # Safe from worker threads; the scheduler flushes it with the heartbeat.
+        self.scheduler._progress[self.job_id] = (min(max(progress, 0.0), 1.0), message)
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _to_info(job_db: Job) -> JobInfo:
+    return JobInfo(
+        id=job_db.id,
+        job_type=job_db.job_type,
+        status=job_db.status,
+        progress=job_db.progress,
+        message=job_db.message,
+        attempts=job_db.attempts,
+        result=job_db.result,
+        error=job_db.error,
+    )
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        db_url: str = DB_URL,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.db_url = db_url
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._progress: dict[int, tuple[float, str]] = {}
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        await self._ensure_table()
+        for job_type in _once:
+            await enqueue(job_type, dedupe_key=f"{job_type}{ONCE_KEY_SUFFIX}")
+        now = _utcnow()
+        for task in _periodic:
+            task.next_run = task.schedule.next_after(now)
+        try:
+            while True:
+                try:
+                    await self._heartbeat()
+                    await self._enqueue_periodic()
+                    await self._dispatch()
+                except Exception:
+                    logger.exception("Job scheduler tick failed.")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            # Cancelled jobs keep their lease and are retried once it expires.
+            for task in self._tasks.values():
+                task.cancel()
+
+    async def _ensure_table(self):
+        async with rx.asession(self.db_url) as session:
+            await session.run_sync(
+                lambda s: Job.__table__.create(s.connection(), checkfirst=True)
+            )
+            await session.commit()
+
+    async def _heartbeat(self):
+        if not self._tasks:
+            return
+        async with rx.asession(self.db_url) as session:
+            lease = time.time() + LEASE_SECONDS
+            for job_id in list(self._tasks):
+                values = {"lease_expires_at": lease}
+                if job_id in self._progress:
+                    values["progress"], values["message"] = self._progress[job_id]
+                await session.execute(
+                    update(Job)
+                    .where(Job.id == job_id, Job.status == JobStatus.RUNNING.value)
+                    .values(**values)
+                )
+            await session.commit()
+
+    async def _enqueue_periodic(self):
+        now = _utcnow()
+        for task in _periodic:
+            if task.next_run is None or task.next_run > now:
+                continue
+            # Every worker process runs this loop; the dedupe key makes sure
+            # each slot is enqueued once.
+            await enqueue(
+                task.job_type,
+                task.payload,
+                priority=task.priority,
+                dedupe_key=f"{task.job_type}@{task.next_run.isoformat()}",
+            )
+            task.next_run = task.schedule.next_after(now)
+
+    async def _dispatch(self):
+        free = self.max_workers - len(self._tasks)
+        if free <= 0:
+            return
+        now = time.time()
+        async with rx.asession(self.db_url) as session:
+            running_result = await session.exec(
+                select(Job.job_type, func.count())
+                .where(
+                    Job.status == JobStatus.RUNNING.value,
+                    Job.lease_expires_at > now,
+                )
+                .group_by(Job.job_type)
+            )
+            running = dict(running_result.all())
+            candidates_result = await session.exec(
+                select(Job)
+                .where(
+                    or_(
+                        and_(Job.status == JobStatus.QUEUED.value, Job.run_at <= now),
+                        and_(
+                            Job.status == JobStatus.RUNNING.value,
+                            Job.lease_expires_at <= now,
+                        ),
+                    )
+                )
+                .order_by(Job.priority.desc(), Job.run_at)
+                .limit(free * 4)
+            )
+            for job_db in candidates_result.all():
+                if free == 0:
+                    break
+                spec = _registry.get(job_db.job_type)
+                if spec is None or running.get(job_db.job_type, 0) >= spec.concurrency:
+                    continue
+                claim = update(Job).where(
+                    Job.id == job_db.id,
+                    Job.status == job_db.status,
+                    Job.lease_expires_at == job_db.lease_expires_at,
+                )
+                if job_db.attempts >= job_db.max_attempts:
+                    await session.execute(
+                        claim.values(
+                            status=JobStatus.FAILED.value,
+                            error=job_db.error or "Job lease expired.",
+                            finished_at=_utcnow().isoformat(),
+                        )
+                    )
+                    await session.commit()
+                    continue
+                # The update below synchronizes job_db, so read the attempt
+                # number before running it.
+                attempt = job_db.attempts + 1
+                claimed = await session.execute(
+                    claim.values(
+                        status=JobStatus.RUNNING.value,
+                        attempts=attempt,
+                        lease_expires_at=now + LEASE_SECONDS,
+                    )
+                )
+                await session.commit()
+                if claimed.rowcount != 1:
+                    continue
+                running[job_db.job_type] = running.get(job_db.job_type, 0) + 1
+                free -= 1
+                self._tasks[job_db.id] = asyncio.create_task(
+                    self._execute(job_db.id, spec, job_db.payload, attempt)
+                )
+
+    async def _execute(self, job_id: int, spec: JobSpec, payload: str, attempt: int):
+        context = JobContext(self, job_id)
+        try:
+            kwargs = json.loads(payload or "{}")
+            if inspect.iscoroutinefunction(spec.handler):
+                work = spec.handler(context, **kwargs)
+            else:
+                work = asyncio.to_thread(spec.handler, context, **kwargs)
+            result = await asyncio.wait_for(work, spec.timeout_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Job %s (%s) failed.", job_id, spec.job_type)
+            await self._finish_failed(job_id, spec, attempt, e)
+        else:
+            await self._finish(
+                job_id,
+                status=JobStatus.SUCCEEDED.value,
+                progress=1.0,
+                result="" if result is None else json.dumps(result),
+                error="",
+                finished_at=_utcnow().isoformat(),
+            )
+        finally:
+            self._tasks.pop(job_id, None)
+            self._progress.pop(job_id, None)
+            self.wake()
+
+    async def _finish_failed(
+        self, job_id: int, spec: JobSpec, attempt: int, error: Exception
+    ):
+        message = f"{type(error).__name__}: {error}"
+        if attempt < spec.max_attempts:
+            await self._finish(
+                job_id,
+                status=JobStatus.QUEUED.value,
+                run_at=time.time() + spec.backoff_seconds * 2 ** (attempt - 1),
+                lease_expires_at=0.0,
+                error=message,
+            )
+        else:
+            await self._finish(
+                job_id,
+                status=JobStatus.FAILED.value,
+                error=message,
+                finished_at=_utcnow().isoformat(),
+            )
+
+    async def _finish(self, job_id: int, **values: Any):
+        async with rx.asession(self.db_url) as session:
+            await session.execute(update(Job).where(Job.id == job_id).values(**values))
+            await session.commit()
+
+    async def get_job(self, job_id: int) -> Optional[JobInfo]:
+        async with rx.asession(self.db_url) as session:
+            result = await session.exec(select(Job).where(Job.id == job_id))
+            job_db = result.one_or_none()
+        if job_db is None:
+            return None
+        info = _to_info(job_db)
+        if job_id in self._progress:
+            info["progress"], info["message"] = self._progress[job_id]
+        return info
+
+
+scheduler = JobScheduler()
+
+
+async def enqueue(
+    job_type: str,
+    payload: Optional[dict] = None,
+    *,
+    priority: int = 0,
+    delay_seconds: float = 0.0,
+    dedupe_key: Optional[str] = None,
+) -> Optional[int]:
+    spec = _registry.get(job_type)
+    if spec is None:
+        raise ValueError(f"Unknown job type {job_type!r}.")
+    new_job = Job(
+        job_type=job_type,
+        payload=json.dumps(payload or {}),
+        priority=priority,
+        max_attempts=spec.max_attempts,
+        run_at=time.time() + delay_seconds,
+        dedupe_key=dedupe_key,
+        created_at=_utcnow().isoformat(),
+    )
+    async with rx.asession(scheduler.db_url) as session:
+        session.add(new_job)
+        try:
+            await session.commit()
+        except IntegrityError:
+            await session.rollback()
+            return None
+        await session.refresh(new_job)
+    scheduler.wake()
+    return new_job.id
+
+
+async def get_job(job_id: int) -> Optional[JobInfo]:
+    return await scheduler.get_job(job_id)
@@ -0,0 +1,87 @@
+import datetime
+import time
+
+import reflex as rx
+
+from . import documents, staging
+from .jobs import ONCE_KEY_SUFFIX, job, periodic
+from .models import JobStatus, sqlite_connection
+
+JOB_RETENTION_DAYS = 14
+# Staged parts keep their mtime when promoted, so give submissions the whole
+# staging TTL plus a margin before treating an unreferenced file as orphaned.
+# This also covers files promoted by a submission whose insert then failed.
+ORPHAN_GRACE_SECONDS = 2 * staging.STAGING_TTL_SECONDS
+
+
+@job("maintenance.analyze")
+def analyze_database(context):
+    with sqlite_connection() as conn:
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+
+
+@job("maintenance.vacuum")
+def vacuum_database(context):
+    with sqlite_connection() as conn:
+        conn.execute("VACUUM")
+
+
+@job("maintenance.sweep_staging")
+def sweep_staging(context):
+    return {"removed": staging.sweep_staging()}
+
+
+@job("maintenance.orphan_documents")
+def remove_orphan_documents(context):
+    with sqlite_connection() as conn:
+        rows = conn.execute(
+            "SELECT documents FROM medicalrequest WHERE documents != ''"
+        ).fetchall()
+    referenced = {name for (documents,) in rows for name in documents.split(",")}
+    cutoff = time.time() - ORPHAN_GRACE_SECONDS
+    # Dotfiles, such as the document URL secret, are not documents.
+    files = [
+        path
+        for path in rx.get_upload_dir().iterdir()
+        if path.is_file() and not path.name.startswith(".")
+    ]
+    removed = 0
+    for index, path in enumerate(files, start=1):
+        if path.name not in referenced and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+        if index % 100 == 0:
+            context.set_progress(index / len(files), f"Checked {index} files")
+    return {
+        "removed": removed,
+        "compressed_removed": documents.prune_compressed_cache(),
+    }
+
+
+@job("maintenance.prune_jobs")
+def prune_jobs(context):
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(
+        days=JOB_RETENTION_DAYS
+    )
+    with sqlite_connection() as conn:
+        # A succeeded run-once job is the record that it already ran.
+        deleted = conn.execute(
+            "DELETE FROM job WHERE status IN (?, ?) AND finished_at < ? "
+            "AND NOT (status = ? AND dedupe_key LIKE ?)",
+            (
+                JobStatus.SUCCEEDED.value,
+                JobStatus.FAILED.value,
+                cutoff.isoformat(),
+                JobStatus.SUCCEEDED.value,
+                f"%{ONCE_KEY_SUFFIX}",
+            ),
+        ).rowcount
+    return {"deleted": deleted}
+
+
+periodic("*/15 * * * *", "maintenance.sweep_staging")
+periodic("30 3 * * *", "maintenance.orphan_documents")
+periodic("0 4 * * *", "maintenance.analyze")
+periodic("45 4 * * 0", "maintenance.vacuum")
+periodic("15 4 * * *", "maintenance.prune_jobs")
@@ -1,8 +1,25 @@
 import reflex as rx
+import contextlib
 import enum
+import sqlite3
 from typing import Optional, TypedDict
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 
+DB_URL = "sqlite+aiosqlite:///reflex.db"
+DB_PATH = DB_URL.removeprefix("sqlite+aiosqlite:///")
+
+
+@contextlib.contextmanager
+def sqlite_connection():
+    # Plain sqlite3 for jobs running in worker threads. Autocommit: callers
+    # that write several rows wrap them in BEGIN/COMMIT themselves.
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
 
 class UserRole(str, enum.Enum):
     COMMON_USER = "common_user"
@@ -15,6 +32,13 @@ class RequestStatus(str, enum.Enum):
     COMPLETED = "completed"
 
 
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
 class User(TypedDict):
     id: int
     email: str
@@ -60,4 +84,44 @@ class MedicalRequest(SQLModel, table=True):
     created_at: str
     status: str
     user_id: int = Field(foreign_key="sqlmodeluser.id")
-    documents: str = ""
\ No newline at end of file
+    documents: str = ""
+
+
+class Job(SQLModel, table=True):
+    __tablename__ = "job"
+    __table_args__ = (
+        Index("ix_job_status_priority_run_at", "status", "priority", "run_at"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_type: str = Field(index=True)
+    payload: str = "{}"
+    status: str = JobStatus.QUEUED.value
+    priority: int = 0
+    attempts: int = 0
+    max_attempts: int = 3
+    run_at: float
+    lease_expires_at: float = 0.0
+    progress: float = 0.0
+    message: str = ""
+    result: str = ""
+    error: str = ""
+    dedupe_key: Optional[str] = Field(default=None, unique=True)
+    created_at: str
+    finished_at: str = ""
+
+
+class RequestSignature(SQLModel, table=True):
+    __tablename__ = "requestsignature"
+    __table_args__ = (
+        Index(
+            "ix_requestsignature_patient_created",
+            "patient_id_number",
+            "created_at",
+        ),
+    )
+    request_id: int = Field(foreign_key="medicalrequest.id", primary_key=True)
+    patient_id_number: str
+    created_at: str
+    minhash: bytes
+    duplicate_of: Optional[int] = None
+    similarity: float = 0.0
@@ -106,7 +106,7 @@ def submit_request_form() -> rx.Component:
                     "Supporting Documents",
                     class_name="text-xl font-semibold text-gray-700 border-b pb-2 mb-6",
                 ),
-                rx.upload.root(
+                rx.el.label(
                     rx.el.div(
                         rx.icon(
                             tag="cloud_upload",
@@ -115,18 +115,15 @@ def submit_request_form() -> rx.Component:
                         rx.el.p("Drag & drop files here, or click to select files"),
                         class_name="text-center p-8 border-2 border-dashed border-gray-300 rounded-lg hover:bg-gray-50 cursor-pointer",
                     ),
-                    id="upload_area",
-                    multiple=True,
-                    accept={
-                        "application/pdf": [".pdf"],
-                        "image/jpeg": [".jpg", ".jpeg"],
-                        "image/png": [".png"],
-                    },
-                    max_files=5,
-                    on_drop=RequestState.handle_upload(
-                        rx.upload_files(upload_id="upload_area")
+                    rx.el.input(
+                        id="upload_area",
+                        type="file",
+                        multiple=True,
+                        accept=".pdf,.jpg,.jpeg,.png,application/pdf,image/jpeg,image/png",
+                        on_change=RequestState.start_upload,
+                        class_name="absolute inset-0 w-full h-full opacity-0 cursor-pointer",
                     ),
-                    class_name="w-full",
+                    class_name="relative block w-full",
                 ),
                 rx.el.div(
                     rx.foreach(
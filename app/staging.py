@@ -0,0 +1,344 @@
+import contextlib
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from pathlib import Path
+from typing import TypedDict
+
+import reflex as rx
+
+ALLOWED_EXTENSIONS = {".pdf", ".jpg", ".jpeg", ".png"}
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+MAX_FILES_PER_SESSION = 5
+STAGING_TTL_SECONDS = 24 * 60 * 60
+# A partial upload that has not received a chunk for this long was abandoned
+# by its client (the script retries for about a minute) and no longer counts
+# towards the per-session file limit.
+ABANDONED_UPLOAD_SECONDS = 2 * 60
+MANIFEST_NAME = "manifest.json"
+TICKET_NAME = "ticket"
+PART_SUFFIX = ".part"
+CONTENT_HASH_LENGTH = 32
+
+_SESSION_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+_UPLOAD_ID_RE = re.compile(r"^[a-f0-9]{32}$")
+_UNSAFE_CHARS_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
+# Manifests are read-modify-written by request handlers on the event loop and
+# by maintenance jobs in worker threads; one lock per session serializes them.
+_session_locks: dict[str, threading.Lock] = {}
+_session_locks_guard = threading.Lock()
+
+
+class StagingError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StagedUpload(TypedDict):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int
+    created_at: float
+    updated_at: float
+
+
+def staging_root() -> Path:
+    return rx.get_upload_dir() / ".staging"
+
+
+def _session_dir(session: str) -> Path:
+    if not _SESSION_RE.match(session or ""):
+        raise StagingError("Invalid upload session.")
+    return staging_root() / session
+
+
+def _part_path(session: str, upload_id: str) -> Path:
+    if not _UPLOAD_ID_RE.match(upload_id or ""):
+        raise StagingError("Invalid upload id.")
+    return _session_dir(session) / f"{upload_id}{PART_SUFFIX}"
+
+
+@contextlib.contextmanager
+def _session_lock(session_dir: Path):
+    with _session_locks_guard:
+        lock = _session_locks.setdefault(session_dir.name, threading.Lock())
+    with lock:
+        yield
+
+
+def _load_manifest(session_dir: Path) -> dict[str, StagedUpload]:
+    try:
+        with (session_dir / MANIFEST_NAME).open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save_manifest(session_dir: Path, manifest: dict[str, StagedUpload]):
+    session_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = session_dir / f"{MANIFEST_NAME}.tmp"
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, session_dir / MANIFEST_NAME)
+
+
+def issue_ticket(session: str) -> str:
+    # Only an authenticated state handler calls this, so the HTTP routes can
+    # tell a real upload session from one a client made up.
+    session_dir = _session_dir(session)
+    ticket_path = session_dir / TICKET_NAME
+    with _session_lock(session_dir):
+        try:
+            ticket = ticket_path.read_text(encoding="utf-8")
+            os.utime(ticket_path)
+            return ticket
+        except FileNotFoundError:
+            pass
+        session_dir.mkdir(parents=True, exist_ok=True)
+        ticket = secrets.token_urlsafe(32)
+        tmp_path = session_dir / f"{TICKET_NAME}.tmp"
+        tmp_path.write_text(ticket, encoding="utf-8")
+        os.replace(tmp_path, ticket_path)
+        return ticket
+
+
+def check_ticket(session: str, ticket: str):
+    try:
+        expected = (_session_dir(session) / TICKET_NAME).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        expected = ""
+    if not expected or not hmac.compare_digest(expected, ticket or ""):
+        raise StagingError("Upload session is not authorized.", status_code=403)
+
+
+def _current_offset(part_path: Path) -> int:
+    try:
+        return part_path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def sanitize_filename(filename: str) -> str:
+    name = _UNSAFE_CHARS_RE.sub("_", Path(filename or "").name).strip("._")
+    return name[:120] or "document"
+
+
+def create_upload(session: str, filename: str, size: int) -> StagedUpload:
+    session_dir = _session_dir(session)
+    safe_name = sanitize_filename(filename)
+    if Path(safe_name).suffix.lower() not in ALLOWED_EXTENSIONS:
+        raise StagingError("Only PDF, JPG and PNG files are allowed.")
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        raise StagingError(
+            f"Files must be between 1 byte and {MAX_UPLOAD_SIZE // (1024 * 1024)} MB.",
+            status_code=413,
+        )
+    with _session_lock(session_dir):
+        manifest = _load_manifest(session_dir)
+        now = time.time()
+        for upload_id, upload in list(manifest.items()):
+            part_path = session_dir / f"{upload_id}{PART_SUFFIX}"
+            if (
+                _current_offset(part_path) < upload["size"]
+                and upload["updated_at"] < now - ABANDONED_UPLOAD_SECONDS
+            ):
+                part_path.unlink(missing_ok=True)
+                del manifest[upload_id]
+        if len(manifest) >= MAX_FILES_PER_SESSION:
+            raise StagingError(
+                f"You can attach at most {MAX_FILES_PER_SESSION} files.",
+                status_code=409,
+            )
+        upload = StagedUpload(
+            upload_id=secrets.token_hex(16),
+            filename=safe_name,
+            size=size,
+            offset=0,
+            created_at=now,
+            updated_at=now,
+        )
+        manifest[upload["upload_id"]] = upload
+        _save_manifest(session_dir, manifest)
+        _part_path(session, upload["upload_id"]).touch()
+    return upload
+
+
+def get_upload(session: str, upload_id: str) -> StagedUpload:
+    part_path = _part_path(session, upload_id)
+    upload = _load_manifest(part_path.parent).get(upload_id)
+    if upload is None:
+        raise StagingError("Upload not found.", status_code=404)
+    upload["offset"] = _current_offset(part_path)
+    return upload
+
+
+def list_uploads(session: str) -> list[StagedUpload]:
+    session_dir = _session_dir(session)
+    uploads = []
+    for upload_id, upload in _load_manifest(session_dir).items():
+        upload["offset"] = _current_offset(session_dir / f"{upload_id}{PART_SUFFIX}")
+        uploads.append(upload)
+    return uploads
+
+
+def is_complete(upload: StagedUpload) -> bool:
+    return upload["offset"] == upload["size"]
+
+
+def max_chunk_size(session: str, upload_id: str, offset: int) -> int:
+    if offset < 0:
+        raise StagingError("Upload-Offset must not be negative.")
+    return max(0, get_upload(session, upload_id)["size"] - offset)
+
+
+def write_chunk(session: str, upload_id: str, offset: int, data: bytes) -> int:
+    if offset < 0:
+        raise StagingError("Upload-Offset must not be negative.")
+    session_dir = _session_dir(session)
+    with _session_lock(session_dir):
+        upload = get_upload(session, upload_id)
+        current = upload["offset"]
+        if offset > current:
+            raise StagingError(
+                f"Chunk offset {offset} is ahead of received offset {current}.",
+                status_code=409,
+            )
+        # Retried chunks may overlap bytes we already have; keep only the new
+        # tail.
+        data = data[current - offset :]
+        if current + len(data) > upload["size"]:
+            raise StagingError(
+                "Chunk exceeds the declared upload size.", status_code=413
+            )
+        if data:
+            with _part_path(session, upload_id).open("ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            manifest = _load_manifest(session_dir)
+            if upload_id in manifest:
+                manifest[upload_id]["updated_at"] = time.time()
+                _save_manifest(session_dir, manifest)
+    return current + len(data)
+
+
+def discard_upload(session: str, upload_id: str):
+    part_path = _part_path(session, upload_id)
+    with _session_lock(part_path.parent):
+        part_path.unlink(missing_ok=True)
+        manifest = _load_manifest(part_path.parent)
+        if manifest.pop(upload_id, None) is not None:
+            _save_manifest(part_path.parent, manifest)
+
+
+def content_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:CONTENT_HASH_LENGTH]
+
+
+def promote_uploads(session: str, upload_ids: list[str]) -> list[str]:
+    if not upload_ids:
+        return []
+    session_dir = _session_dir(session)
+    uploads = [get_upload(session, upload_id) for upload_id in upload_ids]
+    for upload in uploads:
+        if not is_complete(upload):
+            raise StagingError(f"{upload['filename']} has not finished uploading.")
+    # Hashing reads every file in full, so do it before taking the session
+    # lock; complete parts no longer change.
+    hashes = {
+        upload["upload_id"]: content_hash(_part_path(session, upload["upload_id"]))
+        for upload in uploads
+    }
+    upload_dir = rx.get_upload_dir()
+    names: list[str] = []
+    promoted: list[tuple[Path, Path]] = []
+    with _session_lock(session_dir):
+        manifest = _load_manifest(session_dir)
+        for upload in uploads:
+            if upload["upload_id"] not in manifest:
+                raise StagingError(
+                    f"{upload['filename']} is no longer staged.", status_code=404
+                )
+        try:
+            for upload in uploads:
+                source = _part_path(session, upload["upload_id"])
+                # Content-addressed names let the document route cache forever
+                # and store identical scans once.
+                target = (
+                    upload_dir / f"{hashes[upload['upload_id']]}_{upload['filename']}"
+                )
+                if target.exists():
+                    os.utime(target)
+                else:
+                    os.replace(source, target)
+                    promoted.append((source, target))
+                names.append(target.name)
+        except OSError:
+            for source, target in reversed(promoted):
+                os.replace(target, source)
+            raise
+        for upload_id in upload_ids:
+            _part_path(session, upload_id).unlink(missing_ok=True)
+            manifest.pop(upload_id, None)
+        _save_manifest(session_dir, manifest)
+    return names
+
+
+def sweep_staging(max_age: float = STAGING_TTL_SECONDS) -> int:
+    root = staging_root()
+    if not root.is_dir():
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for session_dir in root.iterdir():
+        if session_dir.is_dir():
+            with _session_lock(session_dir):
+                removed += _sweep_session(session_dir, cutoff)
+    return removed
+
+
+def _sweep_session(session_dir: Path, cutoff: float) -> int:
+    if not session_dir.is_dir():
+        return 0
+    removed = 0
+    manifest = _load_manifest(session_dir)
+    live = {
+        upload_id: upload
+        for upload_id, upload in manifest.items()
+        if upload["updated_at"] >= cutoff
+    }
+    for path in session_dir.iterdir():
+        if path.name in (MANIFEST_NAME, TICKET_NAME):
+            continue
+        upload_id = path.name.removesuffix(PART_SUFFIX)
+        # Leftover manifest temp files and parts without a manifest entry come
+        # from crashes mid-write; they are never resumable.
+        if upload_id not in live and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    if not live:
+        (session_dir / MANIFEST_NAME).unlink(missing_ok=True)
+        ticket_path = session_dir / TICKET_NAME
+        if ticket_path.exists() and ticket_path.stat().st_mtime < cutoff:
+            ticket_path.unlink(missing_ok=True)
+        if not any(session_dir.iterdir()):
+            session_dir.rmdir()
+            with _session_locks_guard:
+                _session_locks.pop(session_dir.name, None)
+    elif len(live) != len(manifest):
+        _save_manifest(session_dir, live)
+    return removed
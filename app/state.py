@@ -1,12 +1,18 @@
 import reflex as rx
+import asyncio
 from typing import Optional, TypedDict
 from sqlmodel import select
 import bcrypt
 import datetime
+import json
+from . import audit, dedup, documents, jobs, staging
+from .audit import audit_log
 from .models import (
+    DB_URL,
     User,
     UserRole,
     RequestStatus,
+    JobStatus,
     SQLModelUser,
     MedicalRequest as SQLModelMedicalRequest,
 )
@@ -21,6 +27,7 @@ class RequestState(rx.State):
     is_submitting: bool = False
     form_errors: list[FormValidationError] = []
     uploaded_documents: list[str] = []
+    _staged_upload_ids: list[str] = []
 
     def _validate_form(self, form_data: dict) -> bool:
         self.form_errors = []
@@ -48,21 +55,63 @@ class RequestState(rx.State):
             )
         return len(self.form_errors) == 0
 
+    async def _prune_staged_uploads(self) -> list[str]:
+        session = self.router.session.client_token
+        missing = []
+        staged_ids, names = [], []
+        for upload_id, name in zip(self._staged_upload_ids, self.uploaded_documents):
+            try:
+                await asyncio.to_thread(staging.get_upload, session, upload_id)
+            except staging.StagingError:
+                missing.append(name)
+                continue
+            staged_ids.append(upload_id)
+            names.append(name)
+        self._staged_upload_ids = staged_ids
+        self.uploaded_documents = names
+        return missing
+
+    def _clear_staged_uploads(self):
+        self._staged_upload_ids = []
+        self.uploaded_documents = []
+
     @rx.event
-    async def handle_upload(self, files: list[rx.UploadFile]):
-        if not files:
-            yield rx.toast.error("No files selected.")
-            return
-        for file in files:
-            upload_data = await file.read()
-            unique_name = (
-                f"{datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')}_{file.name}"
+    async def start_upload(self, _value: str):
+        auth_state = await self.get_state(AuthState)
+        if not auth_state.current_user:
+            return rx.toast.error("You must be logged in to upload documents.")
+        await self._prune_staged_uploads()
+        if len(self._staged_upload_ids) >= staging.MAX_FILES_PER_SESSION:
+            return rx.toast.error(
+                f"You can attach at most {staging.MAX_FILES_PER_SESSION} files."
             )
-            path = rx.get_upload_dir() / unique_name
-            with path.open("wb") as f:
-                f.write(upload_data)
-            self.uploaded_documents.append(unique_name)
-        yield rx.toast.success(f"Successfully uploaded {len(files)} files.")
+        session = self.router.session.client_token
+        ticket = await asyncio.to_thread(staging.issue_ticket, session)
+        args = ", ".join(
+            json.dumps(arg) for arg in (rx.config.get_config().api_url, session, ticket)
+        )
+        return rx.call_script(
+            f"resumableUpload({args}, 'upload_area')",
+            callback=RequestState.finish_upload,
+        )
+
+    @rx.event
+    async def finish_upload(self, result: dict):
+        session = self.router.session.client_token
+        completed = 0
+        for upload_id in result.get("upload_ids", []):
+            try:
+                upload = await asyncio.to_thread(staging.get_upload, session, upload_id)
+            except staging.StagingError:
+                continue
+            if staging.is_complete(upload) and upload_id not in self._staged_upload_ids:
+                self._staged_upload_ids.append(upload_id)
+                self.uploaded_documents.append(upload["filename"])
+                completed += 1
+        for error in result.get("errors", []):
+            yield rx.toast.error(error)
+        if completed:
+            yield rx.toast.success(f"Successfully uploaded {completed} files.")
 
     @rx.event
     async def submit_request(self, form_data: dict):
@@ -79,6 +128,28 @@ class RequestState(rx.State):
             yield rx.toast.error("You must be logged in to submit a request.")
             yield rx.redirect("/login")
             return
+        missing = await self._prune_staged_uploads()
+        if missing:
+            self.is_submitting = False
+            yield rx.toast.error(
+                f"{', '.join(missing)} expired before submitting; "
+                "please attach it again."
+            )
+            return
+        try:
+            documents = await asyncio.to_thread(
+                staging.promote_uploads,
+                self.router.session.client_token,
+                self._staged_upload_ids,
+            )
+        except staging.StagingError as e:
+            self.is_submitting = False
+            await self._prune_staged_uploads()
+            yield rx.toast.error(str(e))
+            return
+        created_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        patient_key = dedup.normalize_patient_id(form_data["patient_id_number"])
+        signature = await asyncio.to_thread(dedup.minhash, form_data["symptoms"])
         new_request = SQLModelMedicalRequest(
             patient_name=form_data["patient_name"],
             patient_age=int(form_data["patient_age"]),
@@ -88,20 +159,106 @@ class RequestState(rx.State):
             diagnosis=form_data.get("diagnosis", ""),
             medications=form_data.get("medications", ""),
             medical_history=form_data.get("medical_history", ""),
-            created_at=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            created_at=created_at,
             status=RequestStatus.PENDING.value,
             user_id=auth_state.current_user["id"],
-            documents=",".join(self.uploaded_documents),
+            documents=",".join(documents),
+        )
+        try:
+            async with rx.asession(DB_URL) as session:
+                duplicates = await dedup.find_duplicates(
+                    session, patient_key, signature, created_at
+                )
+                session.add(new_request)
+                await session.flush()
+                session.add(
+                    dedup.build_signature(
+                        new_request.id, patient_key, created_at, signature, duplicates
+                    )
+                )
+                await session.commit()
+                await session.refresh(new_request)
+        except Exception:
+            # Promoted files stay in place; the orphan cleanup job removes
+            # them if nothing ends up referencing them. Their staged ids are
+            # gone, so the form has to start over with fresh attachments.
+            self.is_submitting = False
+            self._clear_staged_uploads()
+            raise
+        audit_log.record(
+            audit.REQUEST_CREATE,
+            user_id=auth_state.current_user["id"],
+            request_id=new_request.id,
+            client_ip=self.router.session.client_ip,
+            documents=len(documents),
         )
-        async with rx.asession("sqlite+aiosqlite:///reflex.db") as session:
-            session.add(new_request)
-            await session.commit()
         self.is_submitting = False
-        self.uploaded_documents = []
+        self._clear_staged_uploads()
         yield rx.toast.success("Medical request submitted successfully!")
+        if duplicates:
+            yield rx.toast.warning(
+                f"This looks like request #{duplicates[0]['request_id']} for the "
+                "same patient; it has been flagged for review."
+            )
         yield rx.redirect("/")
         return
 
+    @rx.event
+    async def open_document(self, name: str):
+        auth_state = await self.get_state(AuthState)
+        if not auth_state.current_user:
+            return rx.toast.error("You must be logged in to view documents.")
+        query = select(SQLModelMedicalRequest).where(
+            SQLModelMedicalRequest.documents.contains(name, autoescape=True)
+        )
+        if not auth_state.is_manager:
+            query = query.where(
+                SQLModelMedicalRequest.user_id == auth_state.current_user["id"]
+            )
+        async with rx.asession(DB_URL) as session:
+            result = await session.exec(query)
+            owner = next(
+                (
+                    request
+                    for request in result.all()
+                    if name in request.documents.split(",")
+                ),
+                None,
+            )
+        if owner is None:
+            return rx.toast.error("Document not found.")
+        audit_log.record(
+            audit.REQUEST_VIEW,
+            user_id=auth_state.current_user["id"],
+            request_id=owner.id,
+            client_ip=self.router.session.client_ip,
+            document=name,
+        )
+        return rx.redirect(documents.document_url(name), is_external=True)
+
+
+class JobState(rx.State):
+    tracked_jobs: dict[str, jobs.JobInfo] = {}
+
+    @rx.event(background=True)
+    async def track_job(self, job_id: int):
+        while True:
+            info = await jobs.get_job(job_id)
+            async with self:
+                # Every registered job is a maintenance job, so only managers
+                # may watch one; re-checked in case they log out mid-poll.
+                auth_state = await self.get_state(AuthState)
+                if not auth_state.is_manager:
+                    self.tracked_jobs.pop(str(job_id), None)
+                    return
+                if info is None:
+                    self.tracked_jobs.pop(str(job_id), None)
+                    return
+                self.tracked_jobs[str(job_id)] = info
+            if info["status"] in (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value):
+                return
+            await asyncio.sleep(jobs.POLL_INTERVAL_SECONDS)
+
 
 class AuthState(rx.State):
     user_id: rx.LocalStorage = ""
@@ -119,7 +276,7 @@ class AuthState(rx.State):
 
     async def _check_session(self):
         if self.user_id:
-            async with rx.asession("sqlite+aiosqlite:///reflex.db") as session:
+            async with rx.asession(DB_URL) as session:
                 result = await session.exec(
                     select(SQLModelUser).where(SQLModelUser.id == self.user_id)
                 )
@@ -152,7 +309,7 @@ class AuthState(rx.State):
             self.error_message = "Email and password are required."
             self.is_loading = False
             return
-        async with rx.asession("sqlite+aiosqlite:///reflex.db") as session:
+        async with rx.asession(DB_URL) as session:
             existing_user_result = await session.exec(
                 select(SQLModelUser).where(SQLModelUser.email == email)
             )
@@ -207,7 +364,7 @@ class AuthState(rx.State):
             self.error_message = "Email and password are required."
             self.is_loading = False
             return
-        async with rx.asession("sqlite+aiosqlite:///reflex.db") as session:
+        async with rx.asession(DB_URL) as session:
             result = await session.exec(
                 select(SQLModelUser).where(SQLModelUser.email == email)
             )
@@ -226,15 +383,32 @@ class AuthState(rx.State):
                 self.is_authenticated = True
                 self.error_message = ""
                 self.is_loading = False
+                audit_log.record(
+                    audit.LOGIN,
+                    user_id=user["id"],
+                    client_ip=self.router.session.client_ip,
+                )
                 yield rx.redirect("/")
                 return
             else:
+                audit_log.record(
+                    audit.LOGIN_FAILED,
+                    user_id=user_db.id if user_db else None,
+                    client_ip=self.router.session.client_ip,
+                    email=email,
+                )
                 self.error_message = "Invalid email or password."
                 self.is_loading = False
                 return
 
     @rx.event
     def logout(self):
+        if self.current_user:
+            audit_log.record(
+                audit.LOGOUT,
+                user_id=self.current_user["id"],
+                client_ip=self.router.session.client_ip,
+            )
         self.user_id = ""
         self.is_authenticated = False
         self.current_user = None
@@ -256,4 +430,4 @@ def protected_page(page_content: rx.Component) -> rx.Component:
             ),
         ),
         on_mount=AuthState.on_load,
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,86 @@
+(function () {
+  const CHUNK_SIZE = 1024 * 1024;
+  const MAX_RETRIES = 6;
+
+  const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+  async function receivedOffset(url, ticket) {
+    const res = await fetch(url, {
+      method: "HEAD",
+      headers: { "Upload-Ticket": ticket },
+    });
+    if (!res.ok) throw new Error(`Upload status failed (${res.status}).`);
+    return parseInt(res.headers.get("Upload-Offset") || "0", 10);
+  }
+
+  async function sendFile(apiUrl, session, ticket, file) {
+    const created = await fetch(`${apiUrl}/api/uploads/${session}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", "Upload-Ticket": ticket },
+      body: JSON.stringify({ filename: file.name, size: file.size }),
+    });
+    const upload = await created.json();
+    if (!created.ok) throw new Error(upload.error || "Upload rejected.");
+    const url = `${apiUrl}/api/uploads/${session}/${upload.upload_id}`;
+    try {
+      await sendChunks(url, ticket, file);
+    } catch (err) {
+      // Free the server-side slot; a failed part can never be resumed here.
+      await fetch(url, {
+        method: "DELETE",
+        headers: { "Upload-Ticket": ticket },
+      }).catch(() => {});
+      throw err;
+    }
+    return upload.upload_id;
+  }
+
+  async function sendChunks(url, ticket, file) {
+    let offset = 0;
+    let retries = 0;
+    while (offset < file.size) {
+      try {
+        const res = await fetch(url, {
+          method: "PATCH",
+          headers: {
+            "Content-Type": "application/offset+octet-stream",
+            "Upload-Offset": String(offset),
+            "Upload-Ticket": ticket,
+          },
+          body: file.slice(offset, offset + CHUNK_SIZE),
+        });
+        if (res.status === 409) {
+          offset = parseInt(res.headers.get("Upload-Offset") || "0", 10);
+          continue;
+        }
+        if (!res.ok) {
+          const body = await res.json().catch(() => ({}));
+          throw Object.assign(new Error(body.error || "Upload failed."), {
+            fatal: res.status < 500,
+          });
+        }
+        offset = parseInt(res.headers.get("Upload-Offset"), 10);
+        retries = 0;
+      } catch (err) {
+        if (err.fatal || ++retries > MAX_RETRIES) throw err;
+        await sleep(500 * 2 ** retries);
+        // Ask the server what it kept so only the missing bytes are re-sent.
+        offset = await receivedOffset(url, ticket).catch(() => offset);
+      }
+    }
+  }
+
+  window.resumableUpload = async function (apiUrl, session, ticket, inputId) {
+    const input = document.getElementById(inputId);
+    const result = { upload_ids: [], errors: [] };
+    for (const file of Array.from(input.files || [])) {
+      try {
+        result.upload_ids.push(await sendFile(apiUrl, session, ticket, file));
+      } catch (err) {
+        result.errors.push(`${file.name}: ${err.message}`);
+      }
+    }
+    input.value = "";
+    return result;
+  };
+})();
@@ -0,0 +1,105 @@
+"""Bandwidth and latency of the document route.
+
+Run from the repository root: python -m benchmarks.bench_documents
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import urllib.parse
+from pathlib import Path
+
+os.environ.setdefault("REFLEX_UPLOADED_FILES_DIR", tempfile.mkdtemp())
+
+from starlette.testclient import TestClient  # noqa: E402
+
+from app import documents, staging  # noqa: E402
+from app.api import api  # noqa: E402
+
+
+def _store(name: str, data: bytes) -> str:
+    upload_dir = Path(os.environ["REFLEX_UPLOADED_FILES_DIR"])
+    tmp_path = upload_dir / f"{name}.tmp"
+    tmp_path.write_bytes(data)
+    stored = f"{staging.content_hash(tmp_path)}_{name}"
+    os.replace(tmp_path, upload_dir / stored)
+    return stored
+
+
+def _scan_pdf(size: int) -> bytes:
+    return b"%PDF-1.4\n" + os.urandom(size)
+
+
+def _text_pdf(size: int) -> bytes:
+    line = b"BT /F1 10 Tf 72 720 Td (Patient reports fever, cough and fatigue.) Tj ET\n"
+    return b"%PDF-1.4\n" + line * (size // len(line))
+
+
+def _measure(client: TestClient, url: str, views: int, headers_for) -> dict:
+    latencies, transferred, statuses = [], 0, set()
+    etag = None
+    for view in range(views):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers_for(view, etag))
+        latencies.append((time.perf_counter() - start) * 1000)
+        # Body size on the wire: compressed bytes when Content-Encoding is set.
+        transferred += int(response.headers.get("content-length", 0))
+        statuses.add(response.status_code)
+        etag = response.headers.get("etag", etag)
+    return {
+        "p50_ms": statistics.median(latencies),
+        "max_ms": max(latencies),
+        "bytes": transferred,
+        "statuses": sorted(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--views", type=int, default=20)
+    parser.add_argument("--scan-mb", type=int, default=20)
+    args = parser.parse_args()
+
+    scan = _store("scan.pdf", _scan_pdf(args.scan_mb * 1024 * 1024))
+    report = _store("report.pdf", _text_pdf(2 * 1024 * 1024))
+    client = TestClient(api)
+    identity = {"accept-encoding": "identity"}
+
+    scenarios = {
+        "scan: full download every view": (
+            scan,
+            lambda view, etag: identity,
+        ),
+        "scan: revalidate with If-None-Match": (
+            scan,
+            lambda view, etag: (
+                {**identity, "if-none-match": etag} if etag else identity
+            ),
+        ),
+        "scan: first 1 MB via Range": (
+            scan,
+            lambda view, etag: {**identity, "range": "bytes=0-1048575"},
+        ),
+        "text pdf: identity": (
+            report,
+            lambda view, etag: identity,
+        ),
+        "text pdf: gzip/br": (
+            report,
+            lambda view, etag: {"accept-encoding": "br, gzip"},
+        ),
+    }
+    print(f"{'scenario':40} {'p50 ms':>8} {'max ms':>8} {'MB sent':>9}  status")
+    for label, (name, headers_for) in scenarios.items():
+        url = urllib.parse.urlsplit(documents.document_url(name))
+        result = _measure(client, f"{url.path}?{url.query}", args.views, headers_for)
+        print(
+            f"{label:40} {result['p50_ms']:8.2f} {result['max_ms']:8.2f} "
+            f"{result['bytes'] / 1024 / 1024:9.2f}  {result['statuses']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""Fixed query benchmark over a database filled by benchmarks.datagen.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.bench_scale --db bench.db --json baseline.json
+"""
+
+import argparse
+import csv
+import datetime
+import io
+import json
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Callable
+
+import bcrypt
+from sqlmodel import Session, create_engine, func, select
+
+from app import dedup
+from app.models import (
+    MedicalRequest,
+    RequestSignature,
+    RequestStatus,
+    SQLModelUser,
+)
+
+from .datagen import BENCH_PASSWORD, SYMPTOM_PHRASES
+
+PERCENTILES = (50, 95, 99)
+# bcrypt and full exports take long enough that a tenth of the runs suffice.
+SLOW_CASES = {"login.full_bcrypt", "export.user_csv", "export.last_week_csv"}
+
+
+def _percentile(samples: list[float], percentile: int) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(percentile / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def _export_csv(rows: list[MedicalRequest]) -> int:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(MedicalRequest.model_fields)
+    for row in rows:
+        writer.writerow(row.model_dump().values())
+    return len(buffer.getvalue())
+
+
+def build_cases(
+    session: Session, rng: random.Random
+) -> dict[str, Callable[[], object]]:
+    user_ids = session.exec(select(SQLModelUser.id)).all()
+    emails = session.exec(select(SQLModelUser.email).limit(1000)).all()
+    max_request_id = session.exec(select(func.max(MedicalRequest.id))).one() or 1
+    patient_ids = session.exec(
+        select(MedicalRequest.patient_id_number).limit(1000)
+    ).all()
+    has_signatures = (
+        session.exec(select(RequestSignature.request_id).limit(1)).first() is not None
+    )
+    now = datetime.datetime.now(datetime.timezone.utc)
+    statuses = [status.value for status in RequestStatus]
+    terms = [phrase.split()[-1] for phrase in SYMPTOM_PHRASES]
+
+    def login_lookup():
+        email = rng.choice(emails)
+        return session.exec(
+            select(SQLModelUser).where(SQLModelUser.email == email)
+        ).one_or_none()
+
+    def login_full():
+        user = login_lookup()
+        return bcrypt.checkpw(
+            BENCH_PASSWORD.encode("utf-8"), user.password_hash.encode("utf-8")
+        )
+
+    def list_user_history():
+        return session.exec(
+            select(MedicalRequest)
+            .where(MedicalRequest.user_id == rng.choice(user_ids))
+            .order_by(MedicalRequest.created_at.desc())
+            .limit(20)
+        ).all()
+
+    def list_manager_recent():
+        return session.exec(
+            select(MedicalRequest).order_by(MedicalRequest.created_at.desc()).limit(50)
+        ).all()
+
+    def list_manager_page():
+        offset = rng.randint(0, 200) * 50
+        return session.exec(
+            select(MedicalRequest)
+            .order_by(MedicalRequest.created_at.desc())
+            .offset(offset)
+            .limit(50)
+        ).all()
+
+    def filter_status():
+        return session.exec(
+            select(MedicalRequest)
+            .where(MedicalRequest.status == rng.choice(statuses))
+            .order_by(MedicalRequest.created_at.desc())
+            .limit(50)
+        ).all()
+
+    def filter_status_date_user():
+        since = now - datetime.timedelta(days=rng.randint(7, 90))
+        return session.exec(
+            select(MedicalRequest)
+            .where(
+                MedicalRequest.user_id == rng.choice(user_ids),
+                MedicalRequest.status == rng.choice(statuses),
+                MedicalRequest.created_at >= since.isoformat(),
+            )
+            .order_by(MedicalRequest.created_at.desc())
+            .limit(50)
+        ).all()
+
+    def count_by_status():
+        return session.exec(
+            select(MedicalRequest.status, func.count()).group_by(MedicalRequest.status)
+        ).all()
+
+    def search_symptoms():
+        return session.exec(
+            select(MedicalRequest)
+            .where(MedicalRequest.symptoms.contains(rng.choice(terms)))
+            .order_by(MedicalRequest.created_at.desc())
+            .limit(50)
+        ).all()
+
+    def search_patient_id():
+        return session.exec(
+            select(MedicalRequest)
+            .where(MedicalRequest.patient_id_number == rng.choice(patient_ids))
+            .limit(50)
+        ).all()
+
+    def get_by_id():
+        return session.get(MedicalRequest, rng.randint(1, max_request_id))
+
+    def export_user():
+        rows = session.exec(
+            select(MedicalRequest).where(MedicalRequest.user_id == rng.choice(user_ids))
+        ).all()
+        return _export_csv(rows)
+
+    def export_last_week():
+        since = now - datetime.timedelta(days=7)
+        rows = session.exec(
+            select(MedicalRequest).where(MedicalRequest.created_at >= since.isoformat())
+        ).all()
+        return _export_csv(rows)
+
+    def duplicate_check():
+        patient_id = dedup.normalize_patient_id(rng.choice(patient_ids))
+        signature = dedup.minhash(" ".join(rng.sample(SYMPTOM_PHRASES, 3)))
+        candidates = session.exec(
+            select(
+                RequestSignature.request_id,
+                RequestSignature.created_at,
+                RequestSignature.minhash,
+            )
+            .where(
+                RequestSignature.patient_id_number == patient_id,
+                RequestSignature.created_at
+                >= (now - datetime.timedelta(days=dedup.WINDOW_DAYS)).isoformat(),
+            )
+            .order_by(RequestSignature.created_at.desc())
+            .limit(dedup.MAX_CANDIDATES)
+        ).all()
+        return dedup.rank_duplicates(signature, list(candidates))
+
+    cases = {
+        "login.lookup": login_lookup,
+        "login.full_bcrypt": login_full,
+        "list.user_history": list_user_history,
+        "list.manager_recent": list_manager_recent,
+        "list.manager_page": list_manager_page,
+        "filter.status": filter_status,
+        "filter.status_date_user": filter_status_date_user,
+        "filter.count_by_status": count_by_status,
+        "search.symptoms_like": search_symptoms,
+        "search.patient_id": search_patient_id,
+        "detail.by_id": get_by_id,
+        "export.user_csv": export_user,
+        "export.last_week_csv": export_last_week,
+    }
+    if has_signatures:
+        cases["dedup.check"] = duplicate_check
+    return cases
+
+
+def run(db_path: Path, iterations: int, seed: int = 7) -> dict:
+    engine = create_engine(f"sqlite:///{db_path}")
+    results = {}
+    with Session(engine) as session:
+        rng = random.Random(seed)
+        cases = build_cases(session, rng)
+        for name, case in cases.items():
+            count = max(3, iterations // 10) if name in SLOW_CASES else iterations
+            case()
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                case()
+                samples.append((time.perf_counter() - start) * 1000)
+                session.expunge_all()
+            results[name] = {
+                "iterations": count,
+                **{f"p{p}_ms": _percentile(samples, p) for p in PERCENTILES},
+                "max_ms": max(samples),
+                "mean_ms": statistics.fmean(samples),
+            }
+        rows = {
+            "users": session.exec(select(func.count()).select_from(SQLModelUser)).one(),
+            "requests": session.exec(
+                select(func.count()).select_from(MedicalRequest)
+            ).one(),
+        }
+    with engine.connect() as conn:
+        page_count = conn.exec_driver_sql("PRAGMA page_count").scalar()
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    engine.dispose()
+    return {
+        "db": str(db_path),
+        "rows": rows,
+        "db_size_bytes": page_count * page_size,
+        "cases": results,
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"{report['db']}: {report['rows']['users']:,} users, "
+        f"{report['rows']['requests']:,} requests, "
+        f"{report['db_size_bytes'] / 1024 / 1024:,.1f} MB"
+    )
+    header = "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES)
+    print(f"{'case':28}{'n':>6}{header}{'max ms':>10}")
+    for name, result in report["cases"].items():
+        values = "".join(f"{result[f'p{p}_ms']:10.2f}" for p in PERCENTILES)
+        print(f"{name:28}{result['iterations']:6}{values}{result['max_ms']:10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=Path, default=Path("bench.db"))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", type=Path, help="Also write the report here.")
+    args = parser.parse_args()
+    report = run(args.db, args.iterations, args.seed)
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
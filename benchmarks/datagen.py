@@ -0,0 +1,294 @@
+"""Fill a database with synthetic users and medical requests.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.datagen --db bench.db --users 20000 --requests 2000000
+"""
+
+import argparse
+import datetime
+import hashlib
+import random
+import sqlite3
+import time
+from pathlib import Path
+
+import bcrypt
+from sqlmodel import SQLModel, create_engine
+
+from app import dedup
+from app.models import RequestStatus, UserRole
+
+BENCH_PASSWORD = "bench123"
+BATCH_SIZE = 50_000
+HISTORY_DAYS = 3 * 365
+FIRST_NAMES = [
+    "Ana",
+    "Carlos",
+    "Lucia",
+    "Jose",
+    "Maria",
+    "Pedro",
+    "Sofia",
+    "Diego",
+    "Valentina",
+    "Juan",
+    "Camila",
+    "Luis",
+    "Isabella",
+    "Miguel",
+    "Elena",
+]
+LAST_NAMES = [
+    "Garcia",
+    "Rodriguez",
+    "Martinez",
+    "Lopez",
+    "Gonzalez",
+    "Perez",
+    "Sanchez",
+    "Ramirez",
+    "Torres",
+    "Flores",
+    "Rivera",
+    "Gomez",
+    "Diaz",
+    "Cruz",
+    "Morales",
+]
+SYMPTOM_PHRASES = [
+    "persistent dry cough",
+    "fever above 38C",
+    "shortness of breath on exertion",
+    "sharp chest pain when breathing deeply",
+    "severe headache behind the eyes",
+    "nausea and vomiting after meals",
+    "lower back pain radiating to the leg",
+    "fatigue for several weeks",
+    "dizziness when standing up",
+    "skin rash on arms",
+    "swelling in both ankles",
+    "abdominal pain in the lower right quadrant",
+    "blurred vision in the left eye",
+    "joint stiffness in the morning",
+    "frequent urination at night",
+    "sore throat and difficulty swallowing",
+    "numbness in the fingers",
+    "palpitations while resting",
+    "loss of appetite",
+    "unexplained weight loss",
+    "night sweats",
+    "chills",
+    "ear pain and pressure",
+]
+SYMPTOM_CONTEXT = [
+    "Symptoms started {n} days ago.",
+    "Patient reports it is worse at night.",
+    "No improvement with over-the-counter medication.",
+    "Family history of diabetes.",
+    "Previously treated for a similar episode {n} months ago.",
+    "Pain rated {n} out of 10.",
+    "Patient is a smoker.",
+    "No known allergies.",
+    "Recently returned from travel.",
+    "Symptoms improve with rest.",
+]
+DIAGNOSES = [
+    "",
+    "",
+    "Upper respiratory infection",
+    "Migraine",
+    "Gastritis",
+    "Hypertension",
+    "Lumbar strain",
+    "Influenza",
+    "Allergic dermatitis",
+    "Anxiety",
+]
+MEDICATIONS = [
+    "",
+    "",
+    "Paracetamol 500mg",
+    "Ibuprofen 400mg",
+    "Omeprazole 20mg",
+    "Losartan 50mg",
+    "Metformin 850mg",
+    "Salbutamol inhaler",
+]
+HISTORY = ["", "", "Asthma", "Diabetes type 2", "Hypertension", "None reported"]
+DOCUMENT_NAMES = ["lab_results.pdf", "xray.jpg", "referral.pdf", "scan.png"]
+
+
+def _symptoms(rng: random.Random) -> str:
+    # Log-normal length: mostly a few sentences, with a long tail of long notes.
+    sentences = max(1, min(60, int(rng.lognormvariate(1.4, 0.8))))
+    parts = []
+    for _ in range(sentences):
+        if rng.random() < 0.6:
+            parts.append(rng.choice(SYMPTOM_PHRASES).capitalize() + ".")
+        else:
+            parts.append(rng.choice(SYMPTOM_CONTEXT).format(n=rng.randint(1, 10)))
+    return " ".join(parts)
+
+
+def _documents(rng: random.Random) -> str:
+    count = rng.choices([0, 1, 2, 3, 5], weights=[45, 30, 15, 7, 3])[0]
+    return ",".join(
+        f"{hashlib.sha256(rng.randbytes(16)).hexdigest()[:32]}_"
+        f"{rng.choice(DOCUMENT_NAMES)}"
+        for _ in range(count)
+    )
+
+
+def _status(rng: random.Random, age_days: float) -> str:
+    # Older requests have mostly been worked through.
+    if age_days > 60:
+        weights = [3, 17, 80]
+    elif age_days > 7:
+        weights = [25, 35, 40]
+    else:
+        weights = [70, 20, 10]
+    return rng.choices([status.value for status in RequestStatus], weights)[0]
+
+
+def _user_weights(rng: random.Random, users: int) -> list[float]:
+    # Pareto-distributed volumes: a few clinics submit most of the requests.
+    return [rng.paretovariate(1.2) for _ in range(users)]
+
+
+def create_schema(db_path: Path):
+    engine = create_engine(f"sqlite:///{db_path}")
+    SQLModel.metadata.create_all(engine)
+    engine.dispose()
+
+
+def generate(
+    db_path: Path,
+    users: int,
+    requests: int,
+    seed: int = 42,
+    with_signatures: bool = False,
+):
+    rng = random.Random(seed)
+    create_schema(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    password_hash = bcrypt.hashpw(
+        BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt()
+    ).decode("utf-8")
+
+    start = time.perf_counter()
+    (first_user_id,) = conn.execute(
+        "SELECT COALESCE(MAX(id), 0) + 1 FROM sqlmodeluser"
+    ).fetchone()
+    user_rows = [
+        (
+            f"user{first_user_id + i}@bench.test",
+            password_hash,
+            UserRole.COMMON_USER.value,
+        )
+        for i in range(users)
+    ]
+    with conn:
+        conn.executemany(
+            "INSERT INTO sqlmodeluser (email, password_hash, role) VALUES (?, ?, ?)",
+            user_rows,
+        )
+    user_ids = list(range(first_user_id, first_user_id + users))
+    weights = _user_weights(rng, users)
+    patient_pool = max(1, requests // 3)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    inserted = 0
+    while inserted < requests:
+        batch = min(BATCH_SIZE, requests - inserted)
+        owners = rng.choices(user_ids, weights=weights, k=batch)
+        rows = []
+        for user_id in owners:
+            age_days = rng.expovariate(1 / 180) % HISTORY_DAYS
+            patient = int(rng.paretovariate(1.5) * 7919) % patient_pool
+            symptoms = _symptoms(rng)
+            rows.append(
+                (
+                    f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    rng.randint(1, 95),
+                    rng.choice(["male", "female", "other"]),
+                    f"{10_000_000 + patient}",
+                    symptoms,
+                    rng.choice(DIAGNOSES),
+                    rng.choice(MEDICATIONS),
+                    rng.choice(HISTORY),
+                    (now - datetime.timedelta(days=age_days)).isoformat(),
+                    _status(rng, age_days),
+                    user_id,
+                    _documents(rng),
+                )
+            )
+        with conn:
+            conn.executemany(
+                "INSERT INTO medicalrequest (patient_name, patient_age, "
+                "patient_gender, patient_id_number, symptoms, diagnosis, "
+                "medications, medical_history, created_at, status, user_id, "
+                "documents) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        inserted += batch
+        print(f"  {inserted:,}/{requests:,} requests", flush=True)
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"Inserted {users:,} users and {requests:,} requests in {elapsed:.1f}s "
+        f"({requests / elapsed:,.0f} rows/s) into {db_path}"
+    )
+
+    if with_signatures:
+        start = time.perf_counter()
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, patient_id_number, created_at, symptoms "
+                "FROM medicalrequest WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO requestsignature (request_id, "
+                    "patient_id_number, created_at, minhash, similarity) "
+                    "VALUES (?, ?, ?, ?, 0.0)",
+                    [
+                        (
+                            request_id,
+                            dedup.normalize_patient_id(patient_id_number),
+                            created_at,
+                            dedup.minhash(symptoms),
+                        )
+                        for request_id, patient_id_number, created_at, symptoms in rows
+                    ],
+                )
+            last_id = rows[-1][0]
+            print(f"  signed up to request {last_id:,}", flush=True)
+        print(f"Signed requests in {time.perf_counter() - start:.1f}s")
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", type=Path, default=Path("bench.db"))
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--with-signatures",
+        action="store_true",
+        help="Also fill requestsignature (slow: one MinHash per row).",
+    )
+    args = parser.parse_args()
+    generate(args.db, args.users, args.requests, args.seed, args.with_signatures)
+
+
+if __name__ == "__main__":
+    main()